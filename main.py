@@ -3,35 +3,75 @@ FX Summary API - EUR to USD exchange rate analysis
 Built for andiron-cursor skills test
 """
 
-import json
+import asyncio
+import functools
+import random
+import time
 import httpx
+import numpy as np
+import orjson
+from contextlib import asynccontextmanager
 from pathlib import Path
 from datetime import date
-from typing import Literal
-from fastapi import FastAPI, Query, HTTPException
-from fastapi.responses import HTMLResponse
-from pydantic import BaseModel
-
-app = FastAPI(
-    title="FX Summary API",
-    description="EUR to USD exchange rate summary with pattern analysis",
-    version="1.0.0"
-)
+from fastapi import FastAPI, Query, HTTPException, Request
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
+from fastapi.staticfiles import StaticFiles
+from pydantic import BaseModel, ConfigDict, TypeAdapter
 
 # Config
 FRANKFURTER_BASE = "https://api.frankfurter.app"
 FALLBACK_FILE = Path(__file__).parent / "data" / "sample_fx.json"
+STATIC_DIR = Path(__file__).parent / "static"
 MAX_RETRIES = 3
+RETRY_BACKOFF = 0.25  # seconds; doubles per attempt so all retries fit within FALLBACK_DEADLINE
+FALLBACK_DEADLINE = 2.0  # seconds to wait for the API before serving fallback data
+ISO_DATE_PATTERN = r"^\d{4}-\d{2}-\d{2}$"
+SUMMARY_CACHE_SIZE = 512
+BREAKER_FAIL_THRESHOLD = 5
+BREAKER_COOLDOWN = 30.0  # seconds
+
+# Historical rates never change, so summaries for closed ranges can be reused
+_SUMMARY_CACHE: dict[tuple[str, str, str], "SummaryResponse"] = {}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Share one pooled HTTP client across requests so connections stay warm."""
+    app.state.http = httpx.AsyncClient(
+        base_url=FRANKFURTER_BASE,
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+        timeout=httpx.Timeout(10.0, connect=3.0)
+    )
+    try:
+        yield
+    finally:
+        await app.state.http.aclose()
+
+
+app = FastAPI(
+    title="FX Summary API",
+    description="EUR to USD exchange rate summary with pattern analysis",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
+)
+# Compress the dashboard and long summary responses
+app.add_middleware(GZipMiddleware, minimum_size=512)
 
 
 # Pydantic models
 class DayRate(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     date: str
     rate: float
     pct_change: float | None  # None for first day
 
 
 class Totals(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     start_rate: float
     end_rate: float
     total_pct_change: float
@@ -39,6 +79,8 @@ class Totals(BaseModel):
 
 
 class SummaryResponse(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     breakdown: list[DayRate] | None  # None when breakdown='none'
     totals: Totals
     source: str  # 'api' or 'fallback'
@@ -49,29 +91,107 @@ class HealthResponse(BaseModel):
     api_reachable: bool
 
 
+# Validates a whole breakdown in one call instead of one model at a time
+_DAYRATE_LIST = TypeAdapter(list[DayRate])
+
+
+class UpstreamRejected(Exception):
+    """The API answered with a 4xx: the request itself is bad, retrying won't help."""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"Upstream rejected request with status {status_code}")
+        self.status_code = status_code
+
+
 # Shield of protection: retry with backoff
 async def fetch_with_retry(client: httpx.AsyncClient, url: str) -> dict | None:
-    """Fetch URL with retry logic. Returns None if all retries fail."""
-    import asyncio
+    """
+    Fetch URL with retry logic. Returns None if all retries fail.
 
+    Only network errors, 5xx and malformed JSON are retried; a 4xx raises
+    UpstreamRejected straight away.
+    """
     for attempt in range(MAX_RETRIES):
         try:
-            response = await client.get(url, timeout=10.0)
-            response.raise_for_status()
-            return response.json()
-        except (httpx.RequestError, httpx.HTTPStatusError) as e:
-            if attempt < MAX_RETRIES - 1:
-                wait_time = 2 ** attempt  # Exponential backoff: 1s, 2s, 4s
-                await asyncio.sleep(wait_time)
-            else:
-                return None
+            response = await client.get(url)
+            # Branch on status instead of raise_for_status() to avoid an exception per 5xx
+            if response.is_success:
+                return orjson.loads(response.content)
+            if response.is_client_error:
+                raise UpstreamRejected(response.status_code)
+        except (httpx.RequestError, orjson.JSONDecodeError):
+            pass
+
+        if attempt < MAX_RETRIES - 1:
+            # Exponential backoff (up to 0.25s, 0.5s) with equal jitter so callers don't retry in lockstep
+            base = RETRY_BACKOFF * 2 ** attempt
+            wait_time = base / 2 + random.random() * base / 2
+            await asyncio.sleep(wait_time)
     return None
 
 
+class CircuitBreaker:
+    """
+    Skip the upstream API after repeated failures.
+
+    CLOSED: calls go through. OPEN (after fail_threshold consecutive failures):
+    calls are refused until cooldown elapses. HALF_OPEN: one trial call is let
+    through; success closes the breaker, failure re-opens it.
+    Failures are upstream faults only (network errors, timeouts, 5xx); a 4xx
+    still means the API answered and counts as a success.
+    Only touched from the event loop, so no locking is needed.
+    """
+
+    def __init__(self, fail_threshold: int = BREAKER_FAIL_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.fail_threshold = fail_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: float | None = None
+
+    def allow(self) -> bool:
+        """Return True if a call to the upstream API should be attempted."""
+        if self.opened_at is None:
+            return True
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            # Half-open: restart the window so only this trial call goes through
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= self.fail_threshold:
+            self.opened_at = time.monotonic()
+
+
+_breaker = CircuitBreaker()
+
+
+@functools.lru_cache(maxsize=1)
 def load_fallback() -> dict:
-    """Load fallback data from local file."""
-    with open(FALLBACK_FILE, "r") as f:
-        return json.load(f)
+    """Load fallback data from local file. Parsed once; treat the result as read-only."""
+    with open(FALLBACK_FILE, "rb") as f:
+        return orjson.loads(f.read())
+
+
+def cache_get(key: tuple[str, str, str]) -> SummaryResponse | None:
+    """Return a cached summary, marking it most recently used."""
+    summary = _SUMMARY_CACHE.pop(key, None)
+    if summary is not None:
+        _SUMMARY_CACHE[key] = summary
+    return summary
+
+
+def cache_put(key: tuple[str, str, str], summary: SummaryResponse) -> None:
+    """Store a summary, evicting the least recently used entry when full."""
+    # Re-putting an existing key (concurrent misses) just moves it to the end
+    if _SUMMARY_CACHE.pop(key, None) is None and len(_SUMMARY_CACHE) >= SUMMARY_CACHE_SIZE:
+        del _SUMMARY_CACHE[next(iter(_SUMMARY_CACHE))]
+    _SUMMARY_CACHE[key] = summary
 
 
 def safe_pct_change(current: float, previous: float) -> float:
@@ -81,36 +201,28 @@ def safe_pct_change(current: float, previous: float) -> float:
     return round(((current - previous) / previous) * 100, 4)
 
 
-def calculate_summary(rates_data: dict, breakdown_type: str) -> SummaryResponse:
+def calculate_summary(rates_data: dict, breakdown_type: str, source: str) -> SummaryResponse:
     """Process rates data into summary response."""
     rates = rates_data.get("rates", {})
 
     if not rates:
         raise HTTPException(status_code=404, detail="No rate data available")
 
-    # Sort by date
-    sorted_dates = sorted(rates.keys())
-
-    # Build day-by-day breakdown
-    day_rates: list[DayRate] = []
-    all_rates: list[float] = []
-    previous_rate: float | None = None
-
-    for d in sorted_dates:
-        rate = rates[d].get("USD", 0.0)
-        all_rates.append(rate)
-
-        pct_change = None
-        if previous_rate is not None:
-            pct_change = safe_pct_change(rate, previous_rate)
-
-        day_rates.append(DayRate(date=d, rate=rate, pct_change=pct_change))
-        previous_rate = rate
+    # ISO dates sort lexicographically and the API already returns them in order,
+    # so only sort when an O(n) check finds a key out of place
+    sorted_dates = list(rates.keys())
+    if not all(a <= b for a, b in zip(sorted_dates, sorted_dates[1:])):
+        sorted_dates.sort()
+    all_rates = np.fromiter(
+        (rates[d].get("USD", 0.0) for d in sorted_dates),
+        dtype=np.float64,
+        count=len(sorted_dates)
+    )
 
     # Calculate totals
-    start_rate = all_rates[0] if all_rates else 0.0
-    end_rate = all_rates[-1] if all_rates else 0.0
-    mean_rate = round(sum(all_rates) / len(all_rates), 4) if all_rates else 0.0
+    start_rate = float(all_rates[0])
+    end_rate = float(all_rates[-1])
+    mean_rate = round(float(all_rates.mean()), 4)
     total_pct_change = safe_pct_change(end_rate, start_rate)
 
     totals = Totals(
@@ -120,33 +232,46 @@ def calculate_summary(rates_data: dict, breakdown_type: str) -> SummaryResponse:
         mean_rate=mean_rate
     )
 
-    return SummaryResponse(
-        breakdown=day_rates if breakdown_type == "day" else None,
-        totals=totals,
-        source=rates_data.get("_source", "api")
-    )
+    # Totals only: no need to build the per-day breakdown
+    if breakdown_type != "day":
+        return SummaryResponse(breakdown=None, totals=totals, source=source)
 
+    # Day-over-day change in one pass; a zero denominator yields 0 like safe_pct_change
+    previous = all_rates[:-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = np.where(previous == 0, 0.0, (all_rates[1:] - previous) / previous * 100)
+    pct_changes = [None] + np.round(pct, 4).tolist()  # None for first day
 
-@app.get("/health", response_model=HealthResponse)
-async def health_check():
+    # Build day-by-day breakdown
+    day_rates = _DAYRATE_LIST.validate_python([
+        {"date": d, "rate": rate, "pct_change": pct_change}
+        for d, rate, pct_change in zip(sorted_dates, all_rates.tolist(), pct_changes)
+    ])
+
+    return SummaryResponse(breakdown=day_rates, totals=totals, source=source)
+
+
+# Models document the schema only; responses are serialized directly, skipping re-validation
+@app.get("/health", response_model=None, responses={200: {"model": HealthResponse}})
+async def health_check(request: Request):
     """Health check endpoint - also tests API connectivity."""
     api_reachable = False
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"{FRANKFURTER_BASE}/latest?from=EUR&to=USD", timeout=5.0)
-            api_reachable = response.status_code == 200
-        except httpx.RequestError:
-            pass
+    try:
+        response = await request.app.state.http.get("/latest?from=EUR&to=USD", timeout=5.0)
+        api_reachable = response.status_code == 200
+    except httpx.RequestError:
+        pass
 
-    return HealthResponse(status="ok", api_reachable=api_reachable)
+    return ORJSONResponse(HealthResponse(status="ok", api_reachable=api_reachable).model_dump())
 
 
-@app.get("/summary", response_model=SummaryResponse)
+@app.get("/summary", response_model=None, responses={200: {"model": SummaryResponse}})
 async def get_summary(
-    start: date = Query(..., description="Start date (YYYY-MM-DD)"),
-    end: date = Query(..., description="End date (YYYY-MM-DD)"),
-    breakdown: Literal["day", "none"] = Query("day", description="'day' for day-by-day, 'none' for totals only")
+    request: Request,
+    start: str = Query(..., pattern=ISO_DATE_PATTERN, description="Start date (YYYY-MM-DD)"),
+    end: str = Query(..., pattern=ISO_DATE_PATTERN, description="End date (YYYY-MM-DD)"),
+    breakdown: str = Query("day", description="'day' for day-by-day, 'none' for totals only")
 ):
     """
     Get EUR to USD exchange rate summary for a date range.
@@ -154,194 +279,70 @@ async def get_summary(
     Returns daily rates with percentage changes and overall statistics.
     Falls back to local data if the Frankfurter API is unavailable.
     """
+    if breakdown != "day" and breakdown != "none":
+        raise HTTPException(status_code=400, detail="breakdown must be 'day' or 'none'")
+
+    # YYYY-MM-DD strings compare in chronological order
     if start > end:
         raise HTTPException(status_code=400, detail="Start date must be before end date")
 
-    url = f"{FRANKFURTER_BASE}/{start}..{end}?from=EUR&to=USD"
-
-    async with httpx.AsyncClient() as client:
-        data = await fetch_with_retry(client, url)
+    cache_key = (start, end, breakdown)
+    cached = cache_get(cache_key)
+    if cached is not None:
+        return ORJSONResponse(cached.model_dump())
+
+    # Cached keys were already valid; check real calendar dates only on a miss
+    try:
+        date.fromisoformat(start)
+        date.fromisoformat(end)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid date: {e}")
+
+    data = None
+    if _breaker.allow():
+        url = f"/{start}..{end}?from=EUR&to=USD"
+        try:
+            # Bound degraded-mode latency: give up on retries past the deadline
+            data = await asyncio.wait_for(fetch_with_retry(request.app.state.http, url), FALLBACK_DEADLINE)
+        except UpstreamRejected:
+            # The API answered, so it is healthy; a bad request must not trip the breaker
+            _breaker.record_success()
+        except asyncio.TimeoutError:
+            _breaker.record_failure()
+        else:
+            if data is None:
+                _breaker.record_failure()
+            else:
+                _breaker.record_success()
 
     if data is None:
         # Fallback to local file
-        data = load_fallback()
-        data["_source"] = "fallback"
+        summary = calculate_summary(load_fallback(), breakdown, "fallback")
     else:
-        data["_source"] = "api"
-
-    return calculate_summary(data, breakdown)
-
-
-@app.get("/", response_class=HTMLResponse)
-async def dashboard():
-    """Simple visualization dashboard."""
-    html = """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>FX Summary - EUR to USD</title>
-        <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
-        <style>
-            body {
-                font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
-                max-width: 900px;
-                margin: 40px auto;
-                padding: 20px;
-                background: #f5f5f5;
-            }
-            h1 { color: #333; }
-            .card {
-                background: white;
-                border-radius: 8px;
-                padding: 20px;
-                margin: 20px 0;
-                box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-            }
-            .form-row { margin: 10px 0; }
-            label { display: inline-block; width: 100px; }
-            input, select { padding: 8px; border: 1px solid #ddd; border-radius: 4px; }
-            button {
-                padding: 10px 20px;
-                background: #007bff;
-                color: white;
-                border: none;
-                border-radius: 4px;
-                cursor: pointer;
-            }
-            button:hover { background: #0056b3; }
-            table { width: 100%; border-collapse: collapse; margin: 20px 0; }
-            th, td { padding: 10px; text-align: left; border-bottom: 1px solid #ddd; }
-            th { background: #f8f9fa; }
-            .positive { color: #28a745; }
-            .negative { color: #dc3545; }
-            .totals { font-weight: bold; background: #e9ecef; }
-            #chart-container { height: 300px; }
-            .pineapple { font-size: 24px; }
-        </style>
-    </head>
-    <body>
-        <h1>FX Summary <span class="pineapple">🍍</span></h1>
-        <p>EUR to USD exchange rate analysis</p>
-
-        <div class="card">
-            <h3>Query Parameters</h3>
-            <div class="form-row">
-                <label>Start Date:</label>
-                <input type="date" id="start" value="2025-01-01">
-            </div>
-            <div class="form-row">
-                <label>End Date:</label>
-                <input type="date" id="end" value="2025-01-10">
-            </div>
-            <div class="form-row">
-                <label>Breakdown:</label>
-                <select id="breakdown">
-                    <option value="day">Day by day</option>
-                    <option value="none">Totals only</option>
-                </select>
-            </div>
-            <div class="form-row">
-                <button onclick="fetchData()">Fetch Rates</button>
-            </div>
-        </div>
-
-        <div class="card" id="results" style="display:none;">
-            <h3>Results <span id="source-badge"></span></h3>
-            <div id="chart-container">
-                <canvas id="chart"></canvas>
-            </div>
-            <table id="data-table"></table>
-        </div>
-
-        <script>
-            let chart = null;
-
-            async function fetchData() {
-                const start = document.getElementById('start').value;
-                const end = document.getElementById('end').value;
-                const breakdown = document.getElementById('breakdown').value;
-
-                try {
-                    const response = await fetch(`/summary?start=${start}&end=${end}&breakdown=${breakdown}`);
-                    const data = await response.json();
-
-                    if (!response.ok) {
-                        alert(data.detail || 'Error fetching data');
-                        return;
-                    }
-
-                    displayResults(data);
-                } catch (err) {
-                    alert('Network error: ' + err.message);
-                }
-            }
-
-            function displayResults(data) {
-                document.getElementById('results').style.display = 'block';
-                document.getElementById('source-badge').textContent =
-                    data.source === 'fallback' ? '(using fallback data)' : '(live data)';
-
-                // Build table
-                let tableHtml = '<tr><th>Date</th><th>Rate (EUR→USD)</th><th>Change</th></tr>';
-
-                if (data.breakdown) {
-                    data.breakdown.forEach(day => {
-                        const changeClass = day.pct_change > 0 ? 'positive' : (day.pct_change < 0 ? 'negative' : '');
-                        const changeStr = day.pct_change !== null ? `${day.pct_change > 0 ? '+' : ''}${day.pct_change}%` : '-';
-                        tableHtml += `<tr><td>${day.date}</td><td>${day.rate.toFixed(4)}</td><td class="${changeClass}">${changeStr}</td></tr>`;
-                    });
-                }
-
-                // Totals row
-                const t = data.totals;
-                const totalClass = t.total_pct_change > 0 ? 'positive' : (t.total_pct_change < 0 ? 'negative' : '');
-                tableHtml += `<tr class="totals"><td>Total</td><td>Mean: ${t.mean_rate.toFixed(4)}</td><td class="${totalClass}">${t.total_pct_change > 0 ? '+' : ''}${t.total_pct_change}%</td></tr>`;
-
-                document.getElementById('data-table').innerHTML = tableHtml;
-
-                // Chart
-                if (data.breakdown && data.breakdown.length > 0) {
-                    const ctx = document.getElementById('chart').getContext('2d');
-
-                    if (chart) chart.destroy();
-
-                    chart = new Chart(ctx, {
-                        type: 'line',
-                        data: {
-                            labels: data.breakdown.map(d => d.date),
-                            datasets: [{
-                                label: 'EUR to USD',
-                                data: data.breakdown.map(d => d.rate),
-                                borderColor: '#007bff',
-                                backgroundColor: 'rgba(0,123,255,0.1)',
-                                fill: true,
-                                tension: 0.1
-                            }]
-                        },
-                        options: {
-                            responsive: true,
-                            maintainAspectRatio: false,
-                            plugins: {
-                                legend: { display: false }
-                            },
-                            scales: {
-                                y: {
-                                    beginAtZero: false,
-                                    title: { display: true, text: 'Rate' }
-                                }
-                            }
-                        }
-                    });
-                }
-            }
-        </script>
-    </body>
-    </html>
-    """
-    return html
+        summary = calculate_summary(data, breakdown, "api")
+
+    # Only live data for ranges that have fully closed is safe to reuse
+    if summary.source == "api" and end < date.today().isoformat():
+        cache_put(cache_key, summary)
+
+    return ORJSONResponse(summary.model_dump())
+
+
+# Dashboard is a static page; mounted last so the API routes above take precedence
+app.mount("/", StaticFiles(directory=STATIC_DIR, html=True), name="static")
 
 
 # 🍍 Pineapple by the door
 if __name__ == "__main__":
+    import os
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # uvloop/httptools are picked up by "auto" when installed (uvloop has no Windows build).
+    # Multiple workers need the app as an import string; caches and breaker are per worker.
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="auto",
+        http="auto",
+        workers=min(4, os.cpu_count() or 1)
+    )